@@ -10,11 +10,15 @@ import streamlit as st
 import json
 import os
 import math
-import base64
 import time
 import contextlib
 from datetime import datetime
-import pandas as pd
+from dataclasses import dataclass, field, fields
+
+try:
+    import orjson  # sérialisation JSON plus rapide si disponible
+except ImportError:
+    orjson = None
 
 # ------------------------
 # Fichiers de config
@@ -27,8 +31,23 @@ LOG_FILE = "calc_audit.log"
 # ------------------------
 # Valeurs par défaut
 # ------------------------
+KV_VALUES = (80, 90, 100, 110, 120)
+# facteurs g I/m² par kV (méthode surface corporelle)
+KV_FACTORS = {80: 11, 90: 13, 100: 15, 110: 16.5, 120: 18.6}
+DEFAULT_CHARGES = {"80": 0.35, "90": 0.38, "100": 0.40, "110": 0.42, "120": 0.45}
+
+# listes d'options des widgets (construites une seule fois par exécution du script)
+CONCENTRATIONS = (300, 320, 350, 370, 400)
+CALC_MODES = ("Charge iodée", "Surface corporelle", "Charge iodée sauf IMC > 30 → Surface corporelle")
+CONCENTRATION_INDEX = {v: i for i, v in enumerate(CONCENTRATIONS)}
+CALC_MODE_INDEX = {v: i for i, v in enumerate(CALC_MODES)}
+# codes entiers des méthodes de calcul (= position dans CALC_MODES)
+MODE_CHARGE, MODE_BSA, MODE_CHARGE_SAUF_IMC30 = range(len(CALC_MODES))
+INJECTION_MODES = ("Portal", "Artériel")
+INJECTION_MODES_INTER = INJECTION_MODES + ("Intermédiaire",)
+
 default_config = {
-    "charges": {str(kv): val for kv, val in zip([80, 90, 100, 110, 120], [0.35, 0.38, 0.40, 0.42, 0.45])},
+    "charges": DEFAULT_CHARGES.copy(),
     "concentration_mg_ml": 350,
     "portal_time": 30.0,
     "arterial_time": 25.0,
@@ -73,6 +92,12 @@ def file_lock(lock_path, timeout=5.0, poll=0.05):
 # ------------------------
 # Utils I/O sécurisées
 # ------------------------
+def file_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
 def audit_log(msg):
     """Ajoute une ligne d'audit (anonymisé) localement."""
     try:
@@ -82,27 +107,64 @@ def audit_log(msg):
     except Exception:
         pass
 
+def loads_json(raw):
+    """Désérialise un contenu JSON UTF-8 (orjson si installé, sinon json de la stdlib)."""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw.decode("utf-8"))
+
+def dumps_json(data):
+    """Sérialise en JSON UTF-8 indenté (orjson si installé, sinon json de la stdlib)."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, indent=4, ensure_ascii=False).encode("utf-8")
+
 def load_json_safe(path, default):
     lock = path + ".lock"
-    if os.path.exists(path):
-        try:
-            with file_lock(lock):
-                with open(path, "r", encoding="utf-8") as f:
-                    return json.load(f)
-        except Exception as e:
-            audit_log(f"LOAD_ERROR {path}: {e}")
-            st.warning(f"⚠️ Erreur lecture '{path}' — valeurs par défaut utilisées.")
-            return default.copy()
-    return default.copy()
+    try:
+        with file_lock(lock):
+            with open(path, "rb") as f:
+                return loads_json(f.read())
+    except FileNotFoundError:
+        # fichier absent (premier lancement) : pas d'avertissement
+        return default.copy()
+    except Exception as e:
+        audit_log(f"LOAD_ERROR {path}: {e}")
+        st.warning(f"⚠️ Erreur lecture '{path}' — valeurs par défaut utilisées.")
+        return default.copy()
+
+def file_signature(path):
+    """(mtime en ns, taille) du fichier, ou None s'il est absent."""
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+    return info.st_mtime_ns, info.st_size
+
+# dernier contenu écrit par ce processus, par fichier : (signature du fichier, octets écrits)
+# cache_resource : un dict global au module serait recréé à chaque rerun complet du script
+@st.cache_resource
+def _last_written():
+    return {}
 
 def save_json_atomic(path, data):
     tmp = path + ".tmp"
     lock = path + ".lock"
     try:
+        payload = dumps_json(data)
+        previous = _last_written().get(path)
+        # comparaison octet à octet (pas de hash) : une sauvegarde réelle n'est jamais sautée
+        if previous is not None and previous == (file_signature(path), payload):
+            return  # contenu identique et fichier non modifié depuis : pas de réécriture
         with file_lock(lock):
-            with open(tmp, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=4, ensure_ascii=False)
+            with open(tmp, "wb") as f:
+                f.write(payload)
+                # données sur disque avant le renommage : pas de fichier tronqué après un arrêt brutal
+                f.flush()
+                os.fsync(f.fileno())
             os.replace(tmp, path)
+            # signature relevée sous le verrou : c'est bien celle du fichier que nous venons d'écrire
+            _last_written()[path] = (file_signature(path), payload)
     except Exception as e:
         audit_log(f"SAVE_ERROR {path}: {e}")
         # en cas d'échec, essayer un fallback non atomique minimaliste
@@ -112,45 +174,74 @@ def save_json_atomic(path, data):
         except Exception as e2:
             audit_log(f"SAVE_FALLBACK_ERROR {path}: {e2}")
 
-def img_to_base64(path):
+# cache_resource : la chaîne (immuable) est partagée telle quelle, sans copie par rerun
+@st.cache_resource(show_spinner=False)
+def _img_to_base64_cached(path, mtime):
+    import base64  # import différé : uniquement utile pour le logo
     with open(path, "rb") as f:
         return base64.b64encode(f.read()).decode()
 
+@st.cache_resource(show_spinner=False)
+def _header_html_cached(path, mtime):
+    return HEADER_TPL.format(img_b64=_img_to_base64_cached(path, mtime))
+
+def header_html(path):
+    """Bandeau d'en-tête complet (logo inclus), construit une fois par version du logo."""
+    # mtime dans la clé : le cache est invalidé si le logo est remplacé
+    return _header_html_cached(path, os.path.getmtime(path))
+
 # ------------------------
-# Charger config & libs
+# Charger config & libs (relecture disque seulement si le fichier a changé)
 # ------------------------
-config_global = load_json_safe(CONFIG_FILE, default_config)
-# libraries left for future but global programs disabled per request
-libraries = load_json_safe(LIB_FILE, {"programs": {}})
-user_sessions = load_json_safe(USER_SESSIONS_FILE, {})
-
-# Normalize older data shapes: ensure each user has keys
-for uid, data in list(user_sessions.items()):
-    if not isinstance(data, dict):
-        user_sessions[uid] = {
-            "programs": {},
-            "config": config_global.copy(),
-            "email": None,
-            "created": datetime.utcnow().isoformat()
-        }
-    else:
-        if "programs" not in data:
-            user_sessions[uid]["programs"] = {}
-        if "config" not in data:
-            user_sessions[uid]["config"] = config_global.copy()
-        if "email" not in data:
-            user_sessions[uid]["email"] = None
-        if "created" not in data:
-            user_sessions[uid]["created"] = datetime.utcnow().isoformat()
+# mtime en argument : la clé de cache change dès que le fichier est réécrit (par nous ou un autre processus)
+@st.cache_resource(max_entries=1)
+def load_config_global(mtime=None):
+    return load_json_safe(CONFIG_FILE, default_config)
+
+@st.cache_resource(max_entries=1)
+def load_libraries(mtime=None):
+    # libraries left for future but global programs disabled per request
+    return load_json_safe(LIB_FILE, {"programs": {}})
+
+@st.cache_resource(max_entries=1)
+def load_user_sessions(mtime=None):
+    """Sessions partagées par le processus : le dict est modifié en place puis sauvegardé."""
+    sessions = load_json_safe(USER_SESSIONS_FILE, {})
+    base_cfg = load_config_global(file_mtime(CONFIG_FILE))
+    # Normalize older data shapes: ensure each user has keys
+    for uid, data in list(sessions.items()):
+        if not isinstance(data, dict):
+            sessions[uid] = {
+                "programs": {},
+                "config": base_cfg.copy(),
+                "email": None,
+                "created": datetime.utcnow().isoformat()
+            }
+        else:
+            if "programs" not in data:
+                sessions[uid]["programs"] = {}
+            if "config" not in data:
+                sessions[uid]["config"] = base_cfg.copy()
+            if "email" not in data:
+                sessions[uid]["email"] = None
+            if "created" not in data:
+                sessions[uid]["created"] = datetime.utcnow().isoformat()
+    return sessions
+
+config_global = load_config_global(file_mtime(CONFIG_FILE))
+libraries = load_libraries(file_mtime(LIB_FILE))
+user_sessions = load_user_sessions(file_mtime(USER_SESSIONS_FILE))
 
 # ------------------------
 # Fonctions métier
 # ------------------------
 def save_config_global(cfg):
     save_json_atomic(CONFIG_FILE, cfg)
+    load_config_global.clear()
 
 def save_libraries(lib):
     save_json_atomic(LIB_FILE, lib)
+    load_libraries.clear()
 
 def save_user_sessions(sessions):
     save_json_atomic(USER_SESSIONS_FILE, sessions)
@@ -161,18 +252,18 @@ def calculate_bsa(weight, height):
     except Exception:
         return None
 
-def calculate_volume(weight, height, kv, concentration_mg_ml, imc, calc_mode, charges, volume_cap):
-    kv_factors = {80: 11, 90: 13, 100: 15, 110: 16.5, 120: 18.6}
-    concentration_g_ml = concentration_mg_ml / 1000.0
+def calculate_volume(weight, height, kv, concentration_g_ml, imc, mode_code, charge_iodine, volume_cap):
+    """Arguments scalaires : charge iodée et concentration en g/mL (cf. CfgView.concentration_g_ml)
+    sont résolues une fois par l'appelant, qui mémorise aussi le résultat dans session_state
+    tant que les entrées ne changent pas."""
     bsa = None
     try:
-        if calc_mode == "Surface corporelle" or (calc_mode.startswith("Charge iodée sauf") and imc >= 30):
+        if mode_code == MODE_BSA or (mode_code == MODE_CHARGE_SAUF_IMC30 and imc >= 30):
             bsa = calculate_bsa(weight, height)
-            factor = kv_factors.get(kv, 15)
+            factor = KV_FACTORS.get(kv, 15)
             volume = bsa * factor / concentration_g_ml
         else:
-            charge_iodine = float(charges.get(str(kv), 0.4))
-            volume = weight * charge_iodine / concentration_g_ml
+            volume = weight * float(charge_iodine) / concentration_g_ml
     except Exception as e:
         audit_log(f"CALC_VOLUME_ERROR: {e}")
         volume = 0.0
@@ -181,25 +272,65 @@ def calculate_volume(weight, height, kv, concentration_mg_ml, imc, calc_mode, ch
         volume = volume_cap
     return volume, bsa
 
-def calculate_acquisition_start(age, cfg):
-    if not cfg.get("auto_acquisition_by_age", True):
-        return float(cfg.get("acquisition_start_param", 70.0))
-    if age < 70:
-        return float(cfg.get("acquisition_start_param", 70.0))
-    elif 70 <= age <= 90:
-        return float(age)
-    else:
-        return 90.0
+def calculate_acquisition_start(age, auto_by_age, manual_start):
+    """Arguments scalaires (cf. CfgView) : pas de lecture de la config à chaque appel."""
+    if not auto_by_age:
+        return manual_start
+    # à partir de 70 ans : départ = âge, plafonné à 90 s ; avant : paramètre manuel
+    return float(min(age, 90)) if age >= 70 else manual_start
 
 def adjust_injection_rate(volume, injection_time, max_debit):
     injection_time = float(injection_time) if injection_time > 0 else 1.0
-    injection_rate = volume / injection_time if injection_time > 0 else 0.0
-    time_adjusted = False
-    if injection_rate > max_debit:
-        injection_time = volume / max_debit
-        injection_rate = max_debit
-        time_adjusted = True
-    return float(injection_rate), float(injection_time), bool(time_adjusted)
+    raw_rate = volume / injection_time
+    # plafonnement sans branche : au-delà du débit max, le temps s'allonge à volume / max_debit
+    injection_rate = min(raw_rate, max_debit)
+    time_adjusted = raw_rate > max_debit
+    injection_time = max(injection_time, volume / max_debit)
+    return injection_rate, injection_time, time_adjusted
+
+def calc_mode_code(calc_mode):
+    """Code entier de la méthode ; un libellé inconnu commençant par "Charge iodée sauf" reste la règle IMC."""
+    code = CALC_MODE_INDEX.get(calc_mode)
+    if code is None:
+        code = MODE_CHARGE_SAUF_IMC30 if calc_mode.startswith("Charge iodée sauf") else MODE_CHARGE
+    return code
+
+def charges_by_kv(charges):
+    """Charges indexées par kV entier (les clés JSON sont des chaînes) : pas de str(kv) à chaque lecture."""
+    return {int(kv): float(val) for kv, val in charges.items()}
+
+@dataclass
+class CfgView:
+    """Vue typée d'une configuration : valeurs par défaut et coercitions appliquées une seule fois."""
+    concentration_mg_ml: float = 350.0
+    calc_mode: str = "Charge iodée"
+    charges: dict = field(default_factory=dict)
+    portal_time: float = 30.0
+    arterial_time: float = 25.0
+    intermediate_enabled: bool = False
+    intermediate_time: float = 28.0
+    arterial_acq_enabled: bool = True
+    arterial_acq_time: float = 25.0
+    auto_acquisition_by_age: bool = True
+    acquisition_start_param: float = 70.0
+    max_debit: float = 6.0
+    rincage_volume: float = 35.0
+    rincage_delta_debit: float = 0.5
+    volume_max_limit: float = 200.0
+    simultaneous_enabled: bool = False
+    target_concentration: float = 350.0
+    concentration_g_ml: float = field(init=False)
+    mode_code: int = field(init=False)
+
+    def __post_init__(self):
+        self.charges = charges_by_kv(self.charges)
+        # concentration en g/mL, partagée par le calcul et son détail (division conservée :
+        # multiplier par l'inverse change l'arrondi affiché du volume à la limite des .5)
+        self.concentration_g_ml = self.concentration_mg_ml / 1000.0
+        self.mode_code = calc_mode_code(self.calc_mode)
+
+def cfg_view(cfg):
+    return CfgView(**{f.name: f.type(cfg[f.name]) for f in fields(CfgView) if f.init and f.name in cfg})
 
 # ------------------------
 # Helpers divers
@@ -220,31 +351,101 @@ def mask_email(e):
 # ------------------------
 # Streamlit UI init
 # ------------------------
-st.set_page_config(page_title="Calculette Contraste Oncologie adulte", page_icon="💉", layout="wide")
-st.markdown("""
+APP_CSS = """
 <style>
 .stApp { background-color: #F7FAFC; font-family: 'Segoe UI', sans-serif; }
 .slider-red .stSlider [data-baseweb="slider"] div[role="slider"] { background-color: #E53935 !important; }
 .slider-red .stSlider [data-baseweb="slider"] div[role="slider"]::before { background-color: #E53935 !important; }
 .divider { border-left: 1px solid #d9d9d9; height: 100%; margin: 0 20px; }
 .info-block { background: #F5F8FC; border-radius: 10px; padding: 15px 20px; text-align: center; color: #123A5F; box-shadow: 0 1px 3px rgba(0,0,0,0.05); }
-.section-title { font-size: 22px; font-weight: 700; color: #123A5F; margin-bottom: 15px; }
+/* Onglet Patient */
+.section-title {font-size:22px;font-weight:700;color:#123A5F;text-align:center;margin-bottom:12px;}
+.block-title {font-weight:700;color:#123A5F;font-size:16px;margin-bottom:6px;text-align:center;}
+div[role="radiogroup"] {
+    display:flex !important;justify-content:center !important;align-items:center !important;
+    gap:12px !important;flex-wrap:nowrap !important;white-space:nowrap !important;
+}
+div[role="radiogroup"] label {
+    font-size:14px !important;padding:4px 12px !important;border-radius:8px !important;
+    background:#F8FAFD !important;border:1px solid #DCE4EC !important;
+}
+div[role="radiogroup"] label:hover {background:#E6EEF8 !important;}
 </style>
-""", unsafe_allow_html=True)
-
-# session state inits
-if "accepted_legal" not in st.session_state:
-    st.session_state["accepted_legal"] = False
-if "user_id" not in st.session_state:
-    st.session_state["user_id"] = None
-if "selected_program" not in st.session_state:
-    st.session_state["selected_program"] = None
+"""
+
+# Pied de page statique (aucune variable : chaîne constante, réémise telle quelle à chaque rerun)
+FOOTER_HTML = """
+<div style='text-align:center; margin-top:20px; font-size:0.8rem; color:#666;'>
+© 2025 Guerbet | Développé par <b>Sébastien Partouche</b><br>
+Calculette de dose de produit de contraste en oncologie adulte.<br>
+Basée sur les recommandations du 
+<a href="https://www.radiologie.fr/sites/www.radiologie.fr/files/medias/documents/CIRTACI%20Fiche%20Généralités%20ONCO_5_3_0.pdf" target="_blank">
+<b>CIRTACI – version 5_3_0</b></a>.<br>
+<div style='display:inline-block; background-color:#FCE8B2; border:1px solid #F5B800; padding:8px 15px; border-radius:10px; color:#5A4500; font-weight:600; margin-top:10px;'>
+🧪 Version BETA TEST – Usage interne / évaluation
+</div>
+</div>
+"""
+
+# Bandeau d'en-tête (logo en base64 injecté par str.format, cf. header_html)
+HEADER_TPL = """
+<div style="display:flex; align-items:center; gap:8px; background:#124F7A; padding:8px; border-radius:8px">
+    <img src="data:image/png;base64,{img_b64}" style="height:55px"/>
+    <h2 style="color:white; margin:0; font-size:26px;">
+        Aide au calcul de dose de produit de contraste en CT — Oncologie adulte
+    </h2>
+</div>
+"""
+
+# Gabarit des cartes de résultats (partie statique construite une fois par exécution du script, remplie par str.format)
+# flex-wrap + largeur mini : les deux cartes s'empilent sur écran étroit, comme le faisait st.columns
+_DROP_SVG = "<svg width='20' height='20' viewBox='0 0 24 24' fill='{color}'><path d='M12 2C12 2 5 10 5 15.5C5 19.09 8.13 22 12 22C15.87 22 19 19.09 19 15.5C19 10 12 2 12 2Z'/></svg>"
+RESULT_CARDS_TPL = """
+    <div style='display:flex;flex-wrap:wrap;gap:1rem;'>
+        <div style='flex:1 1 240px;min-width:240px;background:#E8F5E9;border-left:6px solid #2E7D32;border-radius:12px;padding:18px;text-align:center;'>
+            <h4 style='margin:0;color:#1B5E20;font-weight:700;display:flex;justify-content:center;gap:6px;'>
+                """ + _DROP_SVG.format(color="#2E7D32") + """ Volume et Débit de contraste conseillé
+            </h4>
+            <div style='font-size:22px;color:#1B5E20;font-weight:600;margin-top:8px;'>
+                {volume} mL — {rate:.1f} mL/s
+            </div>
+        </div>
+        <div style='flex:1 1 240px;min-width:240px;background:#E3F2FD;border-left:6px solid #1565C0;border-radius:12px;padding:18px;text-align:center;'>
+            <h4 style='margin:0;color:#0D47A1;font-weight:700;display:flex;justify-content:center;gap:6px;'>
+                """ + _DROP_SVG.format(color="#1565C0") + """ Volume et Débit de NaCl conseillé
+            </h4>
+            <div style='font-size:22px;color:#0D47A1;font-weight:600;margin-top:8px;'>
+                {vol_nacl} mL — {rate_nacl:.1f} mL/s
+            </div>
+        </div>
+    </div>
+"""
+
+def inject_styles():
+    # Streamlit efface les éléments non réémis : la feuille de style (constante) est émise une fois par rerun
+    st.markdown(APP_CSS, unsafe_allow_html=True)
+
+st.set_page_config(page_title="Calculette Contraste Oncologie adulte", page_icon="💉", layout="wide")
+inject_styles()
+
+# session state inits : toutes les clés connues sont amorcées ici, puis lues par indexation directe
+SESSION_DEFAULTS = {
+    "accepted_legal": False,
+    "user_id": None,
+    "selected_program": None,
+    "_calc_key": None,
+}
+for _key, _val in SESSION_DEFAULTS.items():
+    st.session_state.setdefault(_key, _val)
 if "user_config" not in st.session_state:
     st.session_state["user_config"] = config_global.copy()
 
 # helper: active super user name (configurable in config_global)
 SUPER_USER = config_global.get("super_user", "admin")
 
+# année courante : lue une fois par exécution du script (bornes du slider et calcul de l'âge)
+current_year = datetime.now().year
+
 # ------------------------
 # Page d'accueil : Mentions légales + session utilisateur
 # ------------------------
@@ -330,20 +531,10 @@ if not st.session_state["accepted_legal"] or st.session_state["user_id"] is None
 # ------------------------
 
 logo_path = "guerbet_logo.png"
-if os.path.exists(logo_path):
-    try:
-        img_b64 = img_to_base64(logo_path)
-        st.markdown(f"""
-        <div style="display:flex; align-items:center; gap:8px; background:#124F7A; padding:8px; border-radius:8px">
-            <img src="data:image/png;base64,{img_b64}" style="height:55px"/>
-            <h2 style="color:white; margin:0; font-size:26px;">
-                Aide au calcul de dose de produit de contraste en CT — Oncologie adulte
-            </h2>
-        </div>
-        """, unsafe_allow_html=True)
-    except Exception:
-        st.title("Aide au calcul de dose de produit de contraste en CT — Oncologie adulte")
-else:
+try:
+    # logo absent ou illisible (FileNotFoundError compris) : titre texte
+    st.markdown(header_html(logo_path), unsafe_allow_html=True)
+except Exception:
     st.title("Aide au calcul de dose de produit de contraste en CT — Oncologie adulte")
 
 
@@ -354,7 +545,7 @@ tab_patient, tab_params, tab_tutorial = st.tabs(["🧍 Patient", "⚙️ Paramè
 
 # Use working config that refers to the logged-in user's config (kept in session_state)
 def get_cfg():
-    return st.session_state.get("user_config", config_global.copy())
+    return st.session_state["user_config"]
 
 def set_cfg_and_persist(user_id, new_cfg):
     st.session_state["user_config"] = new_cfg.copy()
@@ -372,7 +563,7 @@ with tab_params:
     st.header("⚙️ Paramètres et Bibliothèque (personnelle)")
 
     # ✅ On récupère l'identifiant utilisateur actif
-    user_id = st.session_state.get("user_id", None)
+    user_id = st.session_state["user_id"]
     if not user_id:
         st.error("⚠️ Aucun identifiant utilisateur actif. Veuillez vous reconnecter.")
         st.stop()
@@ -387,7 +578,7 @@ with tab_params:
     personal_programs = user_sessions.get(user_id, {}).get("programs", {})
     program_choice = st.selectbox(
         "Programme (Personnel)",
-        ["Aucun"] + list(personal_programs.keys()),
+        ["Aucun", *personal_programs],
         key="prog_params_personal"
     )
 
@@ -493,14 +684,14 @@ with tab_params:
 
     cfg["concentration_mg_ml"] = st.selectbox(
         "Concentration (mg I/mL)",
-        [300, 320, 350, 370, 400],
-        index=[300, 320, 350, 370, 400].index(int(cfg.get("concentration_mg_ml", 350))),
+        CONCENTRATIONS,
+        index=CONCENTRATION_INDEX.get(int(cfg.get("concentration_mg_ml", 350)), CONCENTRATION_INDEX[350]),
         disabled=disabled
     )
     cfg["calc_mode"] = st.selectbox(
         "Méthode de calcul",
-        ["Charge iodée", "Surface corporelle", "Charge iodée sauf IMC > 30 → Surface corporelle"],
-        index=["Charge iodée", "Surface corporelle", "Charge iodée sauf IMC > 30 → Surface corporelle"].index(cfg.get("calc_mode", "Charge iodée")),
+        CALC_MODES,
+        index=CALC_MODE_INDEX.get(cfg.get("calc_mode", "Charge iodée"), 0),
         disabled=disabled
     )
     cfg["max_debit"] = st.number_input(
@@ -616,15 +807,23 @@ with tab_params:
     # ----------------------------------------------------------------------
     st.markdown("---")
     st.subheader("💊 Charges en iode par kV (g I/kg)")
-    df_charges = pd.DataFrame({
-        "kV": [80, 90, 100, 110, 120],
-        "Charge (g I/kg)": [float(cfg["charges"].get(str(kv), 0.35)) for kv in [80, 90, 100, 110, 120]]
-    })
-    edited_df = st.data_editor(df_charges, num_rows="fixed", use_container_width=True, disabled=disabled)
+    # une grille de 5 champs numériques suffit (pas de DataFrame / data_editor)
+    saved_charges = charges_by_kv(cfg.get("charges", {}))
+    charge_cols = st.columns(len(KV_VALUES))
+    new_charges = {}
+    for col, kv in zip(charge_cols, KV_VALUES):
+        new_charges[str(kv)] = col.number_input(
+            f"{kv} kV",
+            value=saved_charges.get(kv, 0.35),
+            min_value=0.0,
+            step=0.01,
+            format="%.2f",
+            disabled=disabled
+        )
 
     if st.button("💾 Sauvegarder les paramètres", disabled=disabled):
         try:
-            cfg["charges"] = {str(int(row.kV)): float(row["Charge (g I/kg)"]) for _, row in edited_df.iterrows()}
+            cfg["charges"] = new_charges
             set_cfg_and_persist(user_id, cfg)
             st.success("✅ Paramètres sauvegardés dans votre espace utilisateur !")
         except Exception as e:
@@ -640,8 +839,9 @@ with tab_params:
     all_user_ids = sorted(list(user_sessions.keys()))
     if user_id == SUPER_USER:
         st.markdown("**Super-utilisateur : accès à tous les identifiants**")
-        df_users = pd.DataFrame([{"identifiant": uid, "email": user_sessions[uid].get("email")} for uid in all_user_ids])
-        st.dataframe(df_users, use_container_width=True)
+        # liste de dicts passée telle quelle : pas de DataFrame pandas à construire côté application
+        users_rows = [{"identifiant": uid, "email": user_sessions[uid].get("email")} for uid in all_user_ids]
+        st.dataframe(users_rows, use_container_width=True)
         del_input = st.text_input("Identifiant à supprimer (exact)", key="del_input_admin")
         if st.button("🗑 Supprimer identifiant (super-utilisateur)"):
             target = del_input.strip()
@@ -680,43 +880,29 @@ with tab_params:
 # ------------------------
 # Onglet Patient — version finale complète et stable
 # ------------------------
-if "defaults_loaded" not in st.session_state:
-    st.session_state["defaults_loaded"] = True
-    st.session_state["num_poids"] = 70
-    st.session_state["slider_poids"] = 70
-    st.session_state["num_taille"] = 170
-    st.session_state["slider_taille"] = 170
-    st.session_state["num_annee"] = 1985
-    st.session_state["slider_annee"] = 1985
-    st.session_state["kv_scanner_patient"] = 120
-    st.session_state["injection_mode_patient"] = "Portal"
-
-with tab_patient:
-    st.markdown("""
-        <style>
-        .section-title {font-size:22px;font-weight:700;color:#123A5F;text-align:center;margin-bottom:12px;}
-        .block-title {font-weight:700;color:#123A5F;font-size:16px;margin-bottom:6px;text-align:center;}
-        div[role="radiogroup"] {
-            display:flex !important;justify-content:center !important;align-items:center !important;
-            gap:12px !important;flex-wrap:nowrap !important;white-space:nowrap !important;
-        }
-        div[role="radiogroup"] label {
-            font-size:14px !important;padding:4px 12px !important;border-radius:8px !important;
-            background:#F8FAFD !important;border:1px solid #DCE4EC !important;
-        }
-        div[role="radiogroup"] label:hover {background:#E6EEF8 !important;}
-        </style>
-    """, unsafe_allow_html=True)
+PATIENT_DEFAULTS = {
+    "num_poids": 70,
+    "slider_poids": 70,
+    "num_taille": 170,
+    "slider_taille": 170,
+    "num_annee": 1985,
+    "slider_annee": 1985,
+    "kv_scanner_patient": 120,
+    "injection_mode_patient": "Portal",
+}
+for _key, _val in PATIENT_DEFAULTS.items():
+    st.session_state.setdefault(_key, _val)
 
+@st.fragment
+def render_patient_tab():
+    """Onglet Patient isolé dans un fragment : ses widgets ne relancent que ce bloc, pas tout le script."""
     # === Titre principal ===
     st.markdown("<div class='section-title'>🧍 Informations patient</div>", unsafe_allow_html=True)
-    current_year = datetime.now().year
 
     # --- Fonction synchronisée avec réaction immédiate ---
     def sync_slider_with_input(num_key, slider_key, min_val, max_val, step):
-        # Lecture actuelle
-        num_val = st.session_state.get(num_key, 0)
-        slider_val = st.session_state.get(slider_key, 0)
+        # Lecture actuelle (clés amorcées par PATIENT_DEFAULTS)
+        num_val = st.session_state[num_key]
 
         # Champ numérique (prioritaire si modifié)
         num_val_new = st.number_input(
@@ -752,19 +938,24 @@ with tab_patient:
         st.markdown("<div class='block-title'>Programme</div>", unsafe_allow_html=True)
         _uid = st.session_state["user_id"]
         _programs = user_sessions.get(_uid, {}).get("programs", {})
-        prog_choice_patient = st.selectbox("", ["Sélection d'un programme"] + list(_programs.keys()), index=0, label_visibility="collapsed")
-        if prog_choice_patient != "Sélection d'un programme":
+        prog_choice_patient = st.selectbox("", ["Sélection d'un programme", *_programs], index=0, label_visibility="collapsed")
+        if prog_choice_patient == "Sélection d'un programme":
+            st.session_state["selected_program"] = None
+        elif st.session_state["selected_program"] != prog_choice_patient:
+            # n'appliquer et persister le programme qu'au changement de sélection (pas à chaque rerun)
             cfg = get_cfg()
             for k, v in _programs.get(prog_choice_patient, {}).items():
                 cfg[k] = v
-            set_cfg_and_persist(_uid, cfg)
             user_sessions[_uid]["last_selected_program"] = prog_choice_patient
-            save_user_sessions(user_sessions)
+            set_cfg_and_persist(_uid, cfg)
+            st.session_state["selected_program"] = prog_choice_patient
 
     # === Variables patient ===
     cfg = get_cfg()
+    # vue typée de la configuration, construite une seule fois par rerun
+    cv = cfg_view(cfg)
     age = current_year - birth_year
-    imc = weight / ((height / 100) ** 2)
+    imc = weight * 10000.0 / (height * height)
 
     # === Deux blocs principaux ===
     col_left, col_div, col_center = st.columns([1.15, 0.05, 1.15])
@@ -776,21 +967,19 @@ with tab_patient:
         with col_centered:
             kv_scanner = st.radio(
                 "kV",
-                [80, 90, 100, 110, 120],
+                KV_VALUES,
                 horizontal=True,
-                index=[80, 90, 100, 110, 120].index(st.session_state["kv_scanner_patient"]),
+                index=KV_VALUES.index(st.session_state["kv_scanner_patient"]),
                 key="kv_scanner_patient",
                 label_visibility="collapsed"
             )
 
-        charge_iod = float(cfg.get("charges", {}).get(str(kv_scanner), 0.45))
-        concentration = int(cfg.get("concentration_mg_ml", 350))
-        calc_mode_label = cfg.get("calc_mode", "Charge iodée")
+        charge_iod = cv.charges.get(kv_scanner, 0.45)
         st.markdown(
             f"<div style='text-align:center;color:#123A5F;font-size:15px;'>"
             f"<b>Charge iodée :</b> {charge_iod:.2f} g I/kg<br>"
-            f"<b>Concentration :</b> {concentration} mg I/mL<br>"
-            f"<b>Méthode :</b> {calc_mode_label}</div>",
+            f"<b>Concentration :</b> {int(cv.concentration_mg_ml)} mg I/mL<br>"
+            f"<b>Méthode :</b> {cv.calc_mode}</div>",
             unsafe_allow_html=True
         )
 
@@ -800,9 +989,7 @@ with tab_patient:
     # --- Bloc droit : Temps d’injection ---
     with col_center:
         st.markdown("<div class='block-title'>Choix du temps d’injection (en s)</div>", unsafe_allow_html=True)
-        modes = ["Portal", "Artériel"]
-        if cfg.get("intermediate_enabled", False):
-            modes.append("Intermédiaire")
+        modes = INJECTION_MODES_INTER if cv.intermediate_enabled else INJECTION_MODES
 
         _, col_centered, _ = st.columns([1, 2.5, 1])
         with col_centered:
@@ -816,24 +1003,24 @@ with tab_patient:
             )
 
         if injection_mode == "Portal":
-            base_time = float(cfg.get("portal_time", 30.0))
+            base_time = cv.portal_time
         elif injection_mode == "Artériel":
-            base_time = float(cfg.get("arterial_time", 25.0))
+            base_time = cv.arterial_time
         else:
             base_time = st.number_input(
                 "⏱ Temps intermédiaire (s)",
                 min_value=5.0,
                 max_value=120.0,
                 step=0.5,
-                value=float(cfg.get("intermediate_time", 28.0)),
+                value=cv.intermediate_time,
                 key="inter_input"
             )
             st.warning("⚠️ Attention : adaptez votre départ d’acquisition.")
 
-        acq_start = calculate_acquisition_start(age, cfg)
+        acq_start = calculate_acquisition_start(age, cv.auto_acquisition_by_age, cv.acquisition_start_param)
         arterial_line = (
-            f"<br><b>Départ acquisition en artériel :</b> {cfg.get('arterial_acq_time', 25.0):.1f} s"
-            if cfg.get('arterial_acq_enabled', True) else ""
+            f"<br><b>Départ acquisition en artériel :</b> {cv.arterial_acq_time:.1f} s"
+            if cv.arterial_acq_enabled else ""
         )
 
         st.markdown(
@@ -844,94 +1031,79 @@ with tab_patient:
             unsafe_allow_html=True
         )
 
-    # === Calculs principaux ===
-    volume, bsa = calculate_volume(
-        weight, height, kv_scanner,
-        float(cfg.get("concentration_mg_ml", 350)),
-        imc, cfg.get("calc_mode", "Charge iodée"),
-        cfg.get("charges", {}),
-        float(cfg.get("volume_max_limit", 200.0))
-    )
-    injection_rate, injection_time, time_adjusted = adjust_injection_rate(
-        volume, float(base_time), float(cfg.get("max_debit", 6.0))
+    # === Calculs principaux (réutilisés tant que les entrées ne changent pas) ===
+    calc_key = (
+        weight, height, kv_scanner, float(base_time), cv.concentration_mg_ml, cv.mode_code,
+        cv.charges.get(kv_scanner), cv.volume_max_limit, cv.max_debit,
+        cv.rincage_volume, cv.rincage_delta_debit
     )
+    if st.session_state["_calc_key"] != calc_key:
+        volume, bsa = calculate_volume(
+            weight, height, kv_scanner,
+            cv.concentration_g_ml,
+            imc, cv.mode_code,
+            cv.charges.get(kv_scanner, 0.4),
+            cv.volume_max_limit
+        )
+        injection_rate, injection_time, time_adjusted = adjust_injection_rate(
+            volume, float(base_time), cv.max_debit
+        )
+        debit_rincage = max(0.1, injection_rate - cv.rincage_delta_debit)
+
+        # Détail du calcul affiché sous les résultats
+        if cv.mode_code == MODE_CHARGE:
+            calc_str = f"({weight} × {charge_iod:.2f}) ÷ ({cv.concentration_mg_ml}/1000)"
+            iodine_g = weight * charge_iod
+        elif cv.mode_code == MODE_CHARGE_SAUF_IMC30 and imc >= 30:
+            factor = KV_FACTORS.get(kv_scanner, 15)
+            calc_str = f"({bsa:.2f} × {factor}) ÷ ({cv.concentration_mg_ml}/1000)"
+            iodine_g = bsa * factor
+        elif cv.mode_code == MODE_BSA and bsa:
+            factor = KV_FACTORS.get(kv_scanner, 15)
+            calc_str = f"({bsa:.2f} × {factor}) ÷ ({cv.concentration_mg_ml}/1000)"
+            iodine_g = bsa * factor
+        else:
+            calc_str = f"({weight} × {charge_iod:.2f}) ÷ ({cv.concentration_mg_ml}/1000)"
+            iodine_g = weight * charge_iod
+        volume_calc = iodine_g / cv.concentration_g_ml if cv.concentration_g_ml else 0.0
 
-    st.markdown("---")
+        debit_calc = volume_calc / float(base_time)
+        debit_str = f"{volume_calc:.1f} ÷ {base_time:.1f}"
 
-    # === Injection simultanée ===
-    sim_enabled = bool(cfg.get("simultaneous_enabled", False))
-    delta_debit = float(cfg.get("rincage_delta_debit", 0.5))
-    vol_rincage = float(cfg.get("rincage_volume", 35.0))
-    debit_rincage = max(0.1, injection_rate - delta_debit)
+        # le HTML des résultats est mis en forme ici et réutilisé tel quel tant que la clé ne change pas
+        cards_html = RESULT_CARDS_TPL.format(
+            volume=round(volume), rate=injection_rate,
+            vol_nacl=int(cv.rincage_volume), rate_nacl=debit_rincage
+        )
+        detail_html = f"""
+        <div style='text-align:center; margin-top:12px;
+                    font-size:15px; color:#123A5F; line-height:1.6;'>
+            <b>🧮 Volume contraste :</b> {calc_str} = <b>{volume_calc:.1f} mL</b><br>
+            <b>🚀 Débit contraste :</b> {debit_str} = <b>{debit_calc:.2f} mL/s</b>
+        </div>
+    """
+
+        st.session_state["_calc_key"] = calc_key
+        st.session_state["_calc_out"] = (bsa, injection_time, time_adjusted, cards_html, detail_html)
+    bsa, injection_time, time_adjusted, cards_html, detail_html = st.session_state["_calc_out"]
+
+    st.markdown("---")
 
-    if bool(cfg.get("auto_acquisition_by_age", True)):
+    if cv.auto_acquisition_by_age:
         st.info("⏱️ Ajustement automatique selon l’âge activé — le départ d’acquisition est adapté automatiquement.")
 
     # === Résultats visuels ===
-    green_drop = "<svg width='20' height='20' viewBox='0 0 24 24' fill='#2E7D32'><path d='M12 2C12 2 5 10 5 15.5C5 19.09 8.13 22 12 22C15.87 22 19 19.09 19 15.5C19 10 12 2 12 2Z'/></svg>"
-    blue_drop = "<svg width='20' height='20' viewBox='0 0 24 24' fill='#1565C0'><path d='M12 2C12 2 5 10 5 15.5C5 19.09 8.13 22 12 22C15.87 22 19 19.09 19 15.5C19 10 12 2 12 2Z'/></svg>"
-
-    col_contrast, col_nacl = st.columns(2)
-    with col_contrast:
-        st.markdown(f"""
-            <div style='background:#E8F5E9;border-left:6px solid #2E7D32;border-radius:12px;padding:18px;text-align:center;'>
-                <h4 style='margin:0;color:#1B5E20;font-weight:700;display:flex;justify-content:center;gap:6px;'>
-                    {green_drop} Volume et Débit de contraste conseillé
-                </h4>
-                <div style='font-size:22px;color:#1B5E20;font-weight:600;margin-top:8px;'>
-                    {round(volume)} mL — {injection_rate:.1f} mL/s
-                </div>
-            </div>
-        """, unsafe_allow_html=True)
-    with col_nacl:
-        st.markdown(f"""
-            <div style='background:#E3F2FD;border-left:6px solid #1565C0;border-radius:12px;padding:18px;text-align:center;'>
-                <h4 style='margin:0;color:#0D47A1;font-weight:700;display:flex;justify-content:center;gap:6px;'>
-                    {blue_drop} Volume et Débit de NaCl conseillé
-                </h4>
-                <div style='font-size:22px;color:#0D47A1;font-weight:600;margin-top:8px;'>
-                    {int(vol_rincage)} mL — {debit_rincage:.1f} mL/s
-                </div>
-            </div>
-        """, unsafe_allow_html=True)
+    st.markdown(cards_html, unsafe_allow_html=True)
 
     if time_adjusted:
-        st.warning(f"⚠️ Temps ajusté à {injection_time:.1f}s (max {float(cfg.get('max_debit',6.0)):.1f} mL/s).")
+        st.warning(f"⚠️ Temps ajusté à {injection_time:.1f}s (max {cv.max_debit:.1f} mL/s).")
 
     st.info(f"📏 IMC : {imc:.1f}" + (f" | Surface corporelle : {bsa:.2f} m²" if bsa else ""))
 
-    concentration_mg_ml = float(cfg.get("concentration_mg_ml", 350))
-    concentration_g_ml = concentration_mg_ml / 1000.0
-    calc_mode = cfg.get("calc_mode", "Charge iodée")
-    charge_iod = float(cfg.get("charges", {}).get(str(kv_scanner), 0.45))
-
-    if calc_mode == "Charge iodée":
-        calc_str = f"({weight} × {charge_iod:.2f}) ÷ ({concentration_mg_ml}/1000)"
-        volume_calc = weight * charge_iod / concentration_g_ml
-    elif calc_mode.startswith("Charge iodée sauf") and imc >= 30:
-        kv_factors = {80: 11, 90: 13, 100: 15, 110: 16.5, 120: 18.6}
-        factor = kv_factors.get(kv_scanner, 15)
-        calc_str = f"({bsa:.2f} × {factor}) ÷ ({concentration_mg_ml}/1000)"
-        volume_calc = bsa * factor / concentration_g_ml
-    elif calc_mode == "Surface corporelle" and bsa:
-        kv_factors = {80: 11, 90: 13, 100: 15, 110: 16.5, 120: 18.6}
-        factor = kv_factors.get(kv_scanner, 15)
-        calc_str = f"({bsa:.2f} × {factor}) ÷ ({concentration_mg_ml}/1000)"
-        volume_calc = bsa * factor / concentration_g_ml
-    else:
-        calc_str = f"({weight} × {charge_iod:.2f}) ÷ ({concentration_mg_ml}/1000)"
-        volume_calc = weight * charge_iod / concentration_g_ml
-
-    debit_calc = volume_calc / float(base_time)
-    debit_str = f"{volume_calc:.1f} ÷ {base_time:.1f}"
+    st.markdown(detail_html, unsafe_allow_html=True)
 
-    st.markdown(f"""
-        <div style='text-align:center; margin-top:12px;
-                    font-size:15px; color:#123A5F; line-height:1.6;'>
-            <b>🧮 Volume contraste :</b> {calc_str} = <b>{volume_calc:.1f} mL</b><br>
-            <b>🚀 Débit contraste :</b> {debit_str} = <b>{debit_calc:.2f} mL/s</b>
-        </div>
-    """, unsafe_allow_html=True)
+with tab_patient:
+    render_patient_tab()
 
 # ------------------------
 # Onglet Tutoriel (inchangé)
@@ -980,15 +1152,4 @@ with tab_tutorial:
 # ------------------------
 # Footer
 # ------------------------
-st.markdown(f"""
-<div style='text-align:center; margin-top:20px; font-size:0.8rem; color:#666;'>
-© 2025 Guerbet | Développé par <b>Sébastien Partouche</b><br>
-Calculette de dose de produit de contraste en oncologie adulte.<br>
-Basée sur les recommandations du 
-<a href="https://www.radiologie.fr/sites/www.radiologie.fr/files/medias/documents/CIRTACI%20Fiche%20Généralités%20ONCO_5_3_0.pdf" target="_blank">
-<b>CIRTACI – version 5_3_0</b></a>.<br>
-<div style='display:inline-block; background-color:#FCE8B2; border:1px solid #F5B800; padding:8px 15px; border-radius:10px; color:#5A4500; font-weight:600; margin-top:10px;'>
-🧪 Version BETA TEST – Usage interne / évaluation
-</div>
-</div>
-""", unsafe_allow_html=True)
+st.markdown(FOOTER_HTML, unsafe_allow_html=True)